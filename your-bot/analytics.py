@@ -0,0 +1,177 @@
+from collections import defaultdict
+from datetime import date, datetime
+
+import numpy as np
+
+# Корпуса 1 и 2, индекс 0 — комнаты, которые не удалось разобрать
+BUILDINGS = (1, 2)
+N_BUILDINGS = len(BUILDINGS) + 1
+N_WEEKDAYS = 7
+N_HOURS = 24
+
+# Часы, которые предлагаем пользователю для вывоза
+SLOT_HOURS = np.arange(8, 22)
+
+# Веса прошлых недель для прогноза (ближайшая неделя важнее)
+FORECAST_WEIGHTS = np.array([0.4, 0.3, 0.2, 0.1])
+
+WEEKDAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+
+# Разбор отдельных значений из таблицы bookings (-1 — неверный формат)
+def parse_building(room: str) -> int:
+    prefix = str(room).split('-', 1)[0].strip()
+    if prefix.isdigit() and int(prefix) in BUILDINGS:
+        return int(prefix)
+    return 0
+
+
+def parse_date(date_text: str) -> int:
+    try:
+        return datetime.strptime(date_text, "%d.%m.%Y").toordinal()
+    except (TypeError, ValueError):
+        return -1
+
+
+def parse_hour(time_text: str) -> int:
+    try:
+        return datetime.strptime(time_text, "%H:%M").hour
+    except (TypeError, ValueError):
+        return -1
+
+
+def _parse_column(values, parser) -> np.ndarray:
+    # Разбираем только уникальные значения, остальное — через индексы numpy
+    values = np.asarray(values, dtype=str)
+    if values.size == 0:
+        return np.empty(0, dtype=np.int64)
+    unique, inverse = np.unique(values, return_inverse=True)
+    parsed = np.fromiter((parser(value) for value in unique), dtype=np.int64, count=len(unique))
+    return parsed[inverse.ravel()]
+
+
+# Индексы ненулевых значений гистограммы по убыванию (для пиковых часов и дней)
+def busiest(histogram: np.ndarray, limit: int = 3) -> list:
+    nonzero = np.flatnonzero(histogram)
+    order = np.argsort(-histogram[nonzero], kind='stable')
+    return nonzero[order[:limit]].tolist()
+
+
+def _weekday(ordinal):
+    # date.fromordinal(1) — понедельник
+    return (ordinal - 1) % N_WEEKDAYS
+
+
+# Статистика спроса: гистограмма [корпус, день недели, час] и число вывозов по дням
+class DemandModel:
+    def __init__(self):
+        self.counts = np.zeros((N_BUILDINGS, N_WEEKDAYS, N_HOURS), dtype=np.int64)
+        self.daily = defaultdict(lambda: np.zeros(N_BUILDINGS, dtype=np.int64))
+        # Уже забронированные вывозы по часам на сегодня и будущие даты: [корпус, час]
+        self.upcoming = defaultdict(lambda: np.zeros((N_BUILDINGS, N_HOURS), dtype=np.int64))
+        # Дата первого вывоза в истории: недели до неё не участвуют в прогнозе
+        self.first_ordinal = None
+
+    @classmethod
+    def from_records(cls, rooms, dates, times):
+        model = cls()
+        buildings = _parse_column(rooms, parse_building)
+        ordinals = _parse_column(dates, parse_date)
+        hours = _parse_column(times, parse_hour)
+
+        valid = (ordinals >= 0) & (hours >= 0)
+        buildings, ordinals, hours = buildings[valid], ordinals[valid], hours[valid]
+        if ordinals.size == 0:
+            return model
+
+        flat = (buildings * N_WEEKDAYS + _weekday(ordinals)) * N_HOURS + hours
+        model.counts += np.bincount(flat, minlength=model.counts.size).reshape(model.counts.shape)
+
+        model.first_ordinal = int(ordinals.min())
+        keys, key_counts = np.unique(ordinals * N_BUILDINGS + buildings, return_counts=True)
+        for key, count in zip(keys.tolist(), key_counts.tolist()):
+            ordinal, building = divmod(key, N_BUILDINGS)
+            model.daily[ordinal][building] += count
+
+        upcoming = ordinals >= date.today().toordinal()
+        keys, key_counts = np.unique(
+            (ordinals[upcoming] * N_BUILDINGS + buildings[upcoming]) * N_HOURS + hours[upcoming],
+            return_counts=True
+        )
+        for key, count in zip(keys.tolist(), key_counts.tolist()):
+            key, hour = divmod(key, N_HOURS)
+            ordinal, building = divmod(key, N_BUILDINGS)
+            model.upcoming[ordinal][building, hour] += count
+        return model
+
+    # Инкрементальное обновление при создании (delta=1) или отмене (delta=-1) брони
+    def add(self, room: str, date_text: str, time_text: str, delta: int = 1):
+        ordinal = parse_date(date_text)
+        hour = parse_hour(time_text)
+        if ordinal < 0 or hour < 0:
+            return
+        building = parse_building(room)
+        self.counts[building, _weekday(ordinal), hour] += delta
+        self.daily[ordinal][building] += delta
+        if ordinal >= date.today().toordinal():
+            self.upcoming[ordinal][building, hour] += delta
+        if delta > 0 and (self.first_ordinal is None or ordinal < self.first_ordinal):
+            self.first_ordinal = ordinal
+
+    def hourly(self, building: int = None) -> np.ndarray:
+        counts = self.counts if building is None else self.counts[building]
+        return counts.reshape(-1, N_WEEKDAYS, N_HOURS).sum(axis=(0, 1))
+
+    def weekday(self, building: int = None) -> np.ndarray:
+        counts = self.counts if building is None else self.counts[building]
+        return counts.reshape(-1, N_WEEKDAYS, N_HOURS).sum(axis=(0, 2))
+
+    # Наименее загруженные часы для корпуса в выбранный день
+    def suggest_times(self, room: str, date_text: str, limit: int = 3, now: datetime = None) -> list:
+        ordinal = parse_date(date_text)
+        if ordinal < 0:
+            return []
+        building = parse_building(room)
+        weekday = _weekday(ordinal)
+
+        hours = SLOT_HOURS
+        now = now or datetime.now()
+        if ordinal == now.toordinal():
+            hours = hours[hours > now.hour]
+        if hours.size == 0:
+            return []
+
+        # Сначала учитываем брони на выбранную дату, затем историю корпуса,
+        # общую историю и, при равенстве, более ранний час
+        booked = self.upcoming[ordinal][building, hours] if ordinal in self.upcoming else np.zeros(hours.size)
+        load = self.counts[building, weekday, hours]
+        total = self.counts[:, weekday, hours].sum(axis=0)
+        order = np.lexsort((hours, total, load, booked))
+        return [f"{hour:02d}:00" for hour in hours[order[:limit]].tolist()]
+
+    # Прогноз числа вывозов по корпусам на ближайшие дни
+    def forecast(self, start: date = None, days: int = 7) -> list:
+        start = start or date.today()
+        weeks = len(FORECAST_WEIGHTS)
+        result = []
+        for offset in range(days):
+            ordinal = start.toordinal() + offset
+            past = [ordinal - 7 * week for week in range(1, weeks + 1)]
+            history = np.array([self._day(past_ordinal) for past_ordinal in past])
+            # Нормируем только по неделям, для которых уже есть история
+            weights = FORECAST_WEIGHTS * np.array(
+                [self.first_ordinal is not None and past_ordinal >= self.first_ordinal for past_ordinal in past]
+            )
+            if weights.sum() > 0:
+                expected = weights @ history / weights.sum()
+            else:
+                expected = np.zeros(N_BUILDINGS)
+            booked = self._day(ordinal)
+            result.append((date.fromordinal(ordinal), np.maximum(expected, booked), booked))
+        return result
+
+    def _day(self, ordinal: int) -> np.ndarray:
+        # Не используем self.daily[ordinal], чтобы не создавать пустые записи
+        if ordinal in self.daily:
+            return self.daily[ordinal]
+        return np.zeros(N_BUILDINGS, dtype=np.int64)
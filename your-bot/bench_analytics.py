@@ -0,0 +1,72 @@
+import argparse
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from analytics import DemandModel
+
+
+# Генерируем историю бронирований в том же формате, что хранится в bookings.db
+def generate_history(size: int, days: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    start = date.today() - timedelta(days=days)
+
+    room_names = np.array([
+        f"{building}-{floor:02d}-{room:02d}"
+        for building in (1, 2) for floor in range(1, 5) for room in range(1, 21)
+    ])
+    date_names = np.array([(start + timedelta(days=offset)).strftime("%d.%m.%Y") for offset in range(days)])
+    time_names = np.array([f"{hour:02d}:{minute:02d}" for hour in range(24) for minute in (0, 15, 30, 45)])
+
+    rooms = room_names[rng.integers(0, len(room_names), size)]
+    dates = date_names[rng.integers(0, len(date_names), size)]
+    times = time_names[rng.integers(0, len(time_names), size)]
+    return rooms, dates, times
+
+
+def measure(label: str, func, repeat: int = 1):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<40} {best * 1000:10.2f} мс")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк статистики спроса")
+    parser.add_argument('--size', type=int, default=2_000_000, help="число исторических бронирований")
+    parser.add_argument('--days', type=int, default=730, help="глубина истории в днях")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rooms, dates, times = generate_history(args.size, args.days)
+    print(f"Бронирований: {args.size:,}, дней истории: {args.days}")
+
+    model = measure("Построение гистограмм (from_records)",
+                    lambda: DemandModel.from_records(rooms, dates, times), args.repeat)
+
+    # Проверяем, что агрегаты совпадают с наивным подсчётом на Python
+    sample = slice(0, min(args.size, 200_000))
+    naive = DemandModel()
+    measure(f"Наивный подсчёт, {len(rooms[sample]):,} записей",
+            lambda: [naive.add(*row) for row in zip(rooms[sample], dates[sample], times[sample])])
+    vectorized = DemandModel.from_records(rooms[sample], dates[sample], times[sample])
+    assert np.array_equal(naive.counts, vectorized.counts)
+
+    updates = 10_000
+    measure(f"Инкрементальные обновления, {updates:,}",
+            lambda: [model.add(rooms[i], dates[i], times[i]) for i in range(updates)], args.repeat)
+
+    tomorrow = (date.today() + timedelta(days=1)).strftime("%d.%m.%Y")
+    measure("Подбор времени (suggest_times) x1000",
+            lambda: [model.suggest_times("1-02-03", tomorrow) for _ in range(1000)], args.repeat)
+    measure("Прогноз на неделю (forecast) x1000",
+            lambda: [model.forecast() for _ in range(1000)], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Update
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from profiling import Profiler
+
+
+# Диспетчер с обработчиком, который как и бот читает FSM и ходит в БД через сессию
+def build_dispatcher(session_factory):
+    dp = Dispatcher()
+
+    @dp.message()
+    async def handle(message: types.Message, state: FSMContext):
+        await state.get_state()
+        await state.update_data(last=message.text)
+        session = session_factory()
+        try:
+            session.execute(text("SELECT 1")).scalar()
+            session.commit()
+        finally:
+            session.close()
+
+    return dp
+
+
+def make_updates(bot, count):
+    return [
+        Update.model_validate({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(datetime.now().timestamp()),
+                'chat': {'id': 1, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': False, 'first_name': 'Test'},
+                'text': 'hello',
+            },
+        }, context={'bot': bot})
+        for update_id in range(count)
+    ]
+
+
+# Отдельные бот, движок и диспетчер для каждой конфигурации, чтобы хуки не пересекались
+class Setup:
+    def __init__(self, label, sample_rate, batch):
+        self.label = label
+        self.bot = Bot(token="42:TEST")
+        engine = create_engine('sqlite://')
+        session_factory = sessionmaker(bind=engine)
+        self.dp = build_dispatcher(session_factory)
+        self.profiler = None
+        if sample_rate is not None:
+            self.profiler = Profiler(sample_rate=sample_rate,
+                                     dump_path=os.path.join(tempfile.gettempdir(), 'bench.speedscope.json'))
+            self.profiler.install(self.dp, self.bot, engine, session_factory)
+        self.updates = make_updates(self.bot, batch)
+        # Для базовой конфигурации — мкс/апдейт, для остальных — отношение к базовой
+        self.samples = []
+
+    async def run_batch(self):
+        started = time.perf_counter()
+        for update in self.updates:
+            await self.dp.feed_update(self.bot, update)
+        return (time.perf_counter() - started) / len(self.updates) * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк накладных расходов профилирования")
+    parser.add_argument('--batch', type=int, default=300, help="апдейтов в одном замере")
+    parser.add_argument('--rounds', type=int, default=40)
+    parser.add_argument('--max-overhead', type=float, default=5.0,
+                        help="допустимые накладные расходы при выборке 0%%, в процентах")
+    args = parser.parse_args()
+
+    # Логи aiogram о каждом апдейте искажают замеры
+    logging.basicConfig(level=logging.WARNING)
+
+    baseline = Setup("Профилирование выключено", None, args.batch)
+    disabled = Setup("Подключено, выборка 0%", 0.0, args.batch)
+    setups = [baseline, disabled,
+              Setup("Подключено, выборка 10%", 0.1, args.batch),
+              Setup("Подключено, выборка 100%", 1.0, args.batch)]
+
+    for setup in setups:
+        await setup.run_batch()
+
+    # Каждая конфигурация замеряется в паре с базовой, порядок в паре чередуется.
+    # Медиана отношений внутри пар убирает дрейф частоты CPU и шум машины
+    gc.disable()
+    try:
+        for round_number in range(args.rounds):
+            for setup in setups[1:]:
+                pair = (baseline, setup) if round_number % 2 == 0 else (setup, baseline)
+                timings = {id(item): await item.run_batch() for item in pair}
+                setup.samples.append(timings[id(setup)] / timings[id(baseline)])
+                baseline.samples.append(timings[id(baseline)])
+                gc.collect()
+    finally:
+        gc.enable()
+
+    print(f"{baseline.label:<40} {statistics.median(baseline.samples):8.1f} мкс/апдейт")
+    for setup in setups[1:]:
+        print(f"{setup.label:<40} {(statistics.median(setup.samples) - 1) * 100:+8.1f}%")
+    for setup in setups:
+        await setup.bot.session.close()
+
+    if setups[-1].profiler.traces:
+        started = time.perf_counter()
+        setups[-1].profiler.dump()
+        print(f"Выгрузка {len(setups[-1].profiler.traces)} трасс: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    overhead = (statistics.median(disabled.samples) - 1) * 100
+    if overhead > args.max_overhead:
+        print(f"❌ Накладные расходы при выборке 0%: {overhead:.1f}% > {args.max_overhead}%")
+        sys.exit(1)
+    print(f"✅ Накладные расходы при выборке 0%: {overhead:.1f}% (порог {args.max_overhead}%)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
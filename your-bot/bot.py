@@ -13,6 +13,9 @@ from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime,
 from sqlalchemy.orm import declarative_base, sessionmaker
 from dotenv import load_dotenv
 
+from analytics import DemandModel, WEEKDAY_NAMES, BUILDINGS, busiest
+from profiling import Profiler, CATEGORIES
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -28,6 +31,9 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 GROUP_CHAT_ID = os.getenv('GROUP_CHAT_ID')
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
 
+# Режим профилирования (по умолчанию выключен)
+PROFILING = os.getenv('PROFILING', '').lower() in ('1', 'true', 'yes')
+
 # Проверка обязательных переменных
 if not BOT_TOKEN:
     logger.error("BOT_TOKEN не установлен!")
@@ -66,6 +72,41 @@ class Booking(Base):
 # Создаем таблицы
 Base.metadata.create_all(engine)
 
+# Профилировщик подключается только при PROFILING=1, иначе накладных расходов нет
+profiler = None
+if PROFILING:
+    profiler = Profiler(
+        sample_rate=float(os.getenv('PROFILING_SAMPLE_RATE', '0.1')),
+        dump_path=os.getenv('PROFILING_DUMP_PATH', 'profile.speedscope.json'),
+        dump_interval=float(os.getenv('PROFILING_DUMP_INTERVAL', '60'))
+    )
+    profiler.install(dp, bot, engine, Session)
+    logger.info(f"Профилирование включено (доля апдейтов: {profiler.sample_rate})")
+
+# Статистика спроса загружается из БД один раз и дальше обновляется инкрементально
+demand_model = None
+
+
+def get_demand_model():
+    global demand_model
+    if demand_model is None:
+        session = Session()
+        try:
+            rows = session.query(Booking.room, Booking.booking_date, Booking.booking_time).filter(
+                Booking.status != 'cancelled'
+            ).all()
+            rooms, dates, times = zip(*rows) if rows else ((), (), ())
+            demand_model = DemandModel.from_records(rooms, dates, times)
+        finally:
+            session.close()
+    return demand_model
+
+
+def update_demand_model(room, booking_date, booking_time, delta=1):
+    # Если статистика ещё не загружена, она подтянет изменения из БД сама
+    if demand_model is not None:
+        demand_model.add(room, booking_date, booking_time, delta=delta)
+
 
 # Состояния FSM
 class BookingStates(StatesGroup):
@@ -164,6 +205,17 @@ def get_cancel_keyboard():
     )
 
 
+def get_time_keyboard(times):
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text=time_text) for time_text in times],
+            [KeyboardButton(text="❌ Отменить бронирование")]
+        ],
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+
+
 def get_main_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -177,7 +229,8 @@ def get_main_keyboard():
 def get_admin_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="/stats")]
+            [KeyboardButton(text="/stats"), KeyboardButton(text="/forecast")],
+            [KeyboardButton(text="/slowest")]
         ],
         resize_keyboard=True
     )
@@ -279,6 +332,83 @@ async def cmd_my_bookings(message: types.Message):
         session.close()
 
 
+# Прогноз нагрузки на следующую неделю (для администратора)
+@dp.message(Command("forecast"))
+async def cmd_forecast(message: types.Message):
+    if str(message.from_user.id) != ADMIN_CHAT_ID:
+        await message.answer("❌ Эта команда доступна только администратору.")
+        return
+
+    try:
+        model = get_demand_model()
+        forecast_text = "📈 <b>Прогноз вывозов на неделю:</b>\n\n"
+        week_total = 0.0
+        for day, expected, booked in model.forecast():
+            by_building = " | ".join(f"К{building}: {expected[building]:.1f}" for building in BUILDINGS)
+            forecast_text += (
+                f"📅 {day.strftime('%d.%m')} ({WEEKDAY_NAMES[day.weekday()]}): "
+                f"~{expected.sum():.1f} ({by_building}), уже {int(booked.sum())}\n"
+            )
+            week_total += expected.sum()
+        forecast_text += f"\n<b>Всего за неделю:</b> ~{week_total:.0f}"
+
+        busiest_hours = busiest(model.hourly())
+        if busiest_hours:
+            forecast_text += "\n<b>Пиковые часы:</b> " + ", ".join(f"{hour:02d}:00" for hour in busiest_hours)
+        busiest_weekdays = busiest(model.weekday())
+        if busiest_weekdays:
+            forecast_text += "\n<b>Пиковые дни:</b> " + ", ".join(WEEKDAY_NAMES[day] for day in busiest_weekdays)
+
+        await message.answer(forecast_text, parse_mode="HTML")
+    except Exception as e:
+        logger.error(f"Ошибка при построении прогноза: {e}")
+        await message.answer("❌ Ошибка при построении прогноза.")
+
+
+# Максимум апдейтов в ответе /slowest (ограничение длины сообщения Telegram)
+SLOWEST_MAX_LIMIT = 20
+
+
+# Самые медленные апдейты из последних трасс (для администратора)
+@dp.message(Command("slowest"))
+async def cmd_slowest(message: types.Message):
+    if str(message.from_user.id) != ADMIN_CHAT_ID:
+        await message.answer("❌ Эта команда доступна только администратору.")
+        return
+
+    if profiler is None:
+        await message.answer("ℹ️ Профилирование выключено. Запустите бота с PROFILING=1")
+        return
+
+    args = message.text.split()
+    try:
+        limit = int(args[1]) if len(args) > 1 else 5
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        await message.answer(f"❌ Использование: /slowest [1-{SLOWEST_MAX_LIMIT}]\n\nНапример: /slowest 10")
+        return
+    limit = min(limit, SLOWEST_MAX_LIMIT)
+
+    traces = profiler.slowest(limit)
+    if not traces:
+        await message.answer("📭 Пока нет сохранённых трасс.")
+        return
+
+    slowest_text = f"🐢 <b>Самые медленные апдейты</b> (из {len(profiler.traces)}):\n"
+    for trace in traces:
+        totals = trace.totals()
+        breakdown = " | ".join(f"{category}: {totals[category] * 1000:.1f}" for category in CATEGORIES)
+        slowest_text += f"""
+<b>#{trace.update_id}</b> {trace.handler or trace.update_type} — {trace.duration * 1000:.0f} мс
+⏱ {breakdown} мс
+⏳ {trace.created_at.strftime('%d.%m.%Y %H:%M:%S')}
+"""
+
+    slowest_text += "\nℹ️ handler — работа кода обработчика, wait — ожидание других апдейтов"
+    await message.answer(slowest_text, parse_mode="HTML")
+
+
 # Команда отмены бронирования (во время процесса)
 @dp.message(Command("cancel"))
 @dp.message(F.text == "❌ Отменить бронирование")
@@ -445,8 +575,25 @@ async def process_date(message: types.Message, state: FSMContext):
             return
 
         await state.update_data(date=date_text)
-        await message.answer("⏰ Введите время вывоза (в формате ЧЧ:ММ, например 14:30):",
-                             reply_markup=get_cancel_keyboard())
+
+        # Предлагаем наименее загруженное время для корпуса.
+        # Статистика загружается при запуске; если загрузить не удалось, время не подсказываем
+        user_data = await state.get_data()
+        suggested_times = []
+        if demand_model is not None:
+            try:
+                suggested_times = demand_model.suggest_times(user_data['room'], date_text)
+            except Exception as e:
+                logger.error(f"Ошибка при подборе времени: {e}")
+
+        if suggested_times:
+            await message.answer(
+                "⏰ Введите время вывоза (в формате ЧЧ:ММ, например 14:30) или выберите свободное время:",
+                reply_markup=get_time_keyboard(suggested_times)
+            )
+        else:
+            await message.answer("⏰ Введите время вывоза (в формате ЧЧ:ММ, например 14:30):",
+                                 reply_markup=get_cancel_keyboard())
         await state.set_state(BookingStates.time)
     except ValueError:
         await message.answer("❌ Неверный формат даты. Пожалуйста, введите дату в формате ДД.ММ.ГГГГ:",
@@ -538,6 +685,7 @@ async def process_confirmation(message: types.Message, state: FSMContext):
             )
             session.add(booking)
             session.commit()
+            update_demand_model(booking.room, booking.booking_date, booking.booking_time)
 
             # Сообщение пользователю
             success_text = f"""
@@ -640,6 +788,7 @@ async def cmd_cancel_booking(message: types.Message):
         booking.status = 'cancelled'
         booking.updated_at = datetime.now()
         session.commit()
+        update_demand_model(booking.room, booking.booking_date, booking.booking_time, delta=-1)
 
         await message.answer(f"✅ Бронирование #{booking_id} успешно отменено.")
 
@@ -686,7 +835,19 @@ async def handle_other_messages(message: types.Message, state: FSMContext):
 # Запуск бота
 async def main():
     logger.info("Запуск бота...")
-    await dp.start_polling(bot)
+    # Загружаем статистику спроса до начала опроса и вне event loop.
+    # Без неё бот работает, просто не подсказывает время
+    try:
+        await asyncio.to_thread(get_demand_model)
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке статистики спроса: {e}")
+    dumper = asyncio.create_task(profiler.run_dumper()) if profiler else None
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if dumper:
+            dumper.cancel()
+            profiler.dump()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.storage.base import BaseStorage
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Категории времени внутри одного апдейта.
+# HANDLER — время, когда задача апдейта реально выполнялась на event loop
+# (код обработчика и aiogram) за вычетом FSM / БД / API.
+# WAIT — остаток: задача ждала, пока event loop выполнял другие апдейты
+FSM = 'fsm'
+DB = 'db'
+API = 'api'
+HANDLER = 'handler'
+WAIT = 'wait'
+CATEGORIES = (FSM, DB, API, HANDLER, WAIT)
+
+# Через сколько секунд без апдейтов из выборки снимаются хуки профилирования
+DETACH_DELAY = 1.0
+
+# Трасса текущего апдейта (None — апдейт не попал в выборку)
+current_trace = ContextVar('current_trace', default=None)
+
+
+# Трасса одного апдейта: общее время и отрезки FSM / БД / Telegram API
+class UpdateTrace:
+    __slots__ = ('update_id', 'update_type', 'handler', 'created_at', 'start', 'duration', 'spans', 'steps',
+                 'db_stack')
+
+    def __init__(self, update_id, update_type):
+        self.update_id = update_id
+        self.update_type = update_type
+        self.handler = None
+        self.created_at = datetime.now()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans = []
+        # Шаги задачи апдейта на event loop (между её приостановками)
+        self.steps = []
+        self.db_stack = []
+
+    def add_span(self, category, name, start, end):
+        self.spans.append((category, name, start - self.start, end - self.start))
+
+    # Операции БД вложены друг в друга (commit -> flush -> execute),
+    # в трассу попадает только внешняя, чтобы время не считалось дважды
+    def db_begin(self, name):
+        self.db_stack.append((name, time.perf_counter()))
+
+    def db_end(self, close_all=False):
+        end = time.perf_counter()
+        while self.db_stack:
+            name, start = self.db_stack.pop()
+            if not self.db_stack:
+                self.add_span(DB, name, start, end)
+            if not close_all:
+                break
+
+    def add_step(self, start, end):
+        self.steps.append((start - self.start, end - self.start))
+
+    def totals(self):
+        totals = dict.fromkeys(CATEGORIES, 0.0)
+        for category, _, start, end in self.spans:
+            totals[category] += end - start
+        # Время шагов, не покрытое отрезками FSM / БД / API
+        on_cpu = 0.0
+        for step_start, step_end in self.steps:
+            on_cpu += step_end - step_start
+            for _, _, start, end in self.spans:
+                on_cpu -= max(min(end, step_end) - max(start, step_start), 0.0)
+        totals[HANDLER] = max(on_cpu, 0.0)
+        totals[WAIT] = max(self.duration - sum(totals[category] for category in (FSM, DB, API, HANDLER)), 0.0)
+        return totals
+
+
+# Обёртка над корутиной апдейта, замеряющая каждый её шаг (send/throw) на event loop
+class TimedCoroutine:
+    def __init__(self, coro, trace):
+        self.coro = coro
+        self.trace = trace
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            start = time.perf_counter()
+            try:
+                if error is None:
+                    future = self.coro.send(value)
+                else:
+                    future = self.coro.throw(error)
+            except StopIteration as stop:
+                self.trace.add_step(start, time.perf_counter())
+                return stop.value
+            except BaseException:
+                self.trace.add_step(start, time.perf_counter())
+                raise
+            self.trace.add_step(start, time.perf_counter())
+            value, error = None, None
+            try:
+                value = yield future
+            except BaseException as e:
+                error = e
+
+
+# Обёртка над FSM-хранилищем, замеряющая время доступа к состоянию
+class ProfiledStorage(BaseStorage):
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def _timed(self, name, call):
+        trace = current_trace.get()
+        if trace is None:
+            return await call
+        start = time.perf_counter()
+        try:
+            return await call
+        finally:
+            trace.add_span(FSM, name, start, time.perf_counter())
+
+    async def set_state(self, key, state=None):
+        return await self._timed('set_state', self.storage.set_state(key, state))
+
+    async def get_state(self, key):
+        return await self._timed('get_state', self.storage.get_state(key))
+
+    async def set_data(self, key, data):
+        return await self._timed('set_data', self.storage.set_data(key, data))
+
+    async def get_data(self, key):
+        return await self._timed('get_data', self.storage.get_data(key))
+
+    async def update_data(self, key, data):
+        return await self._timed('update_data', self.storage.update_data(key, data))
+
+    async def close(self):
+        await self.storage.close()
+
+
+# Middleware сессии бота, замеряющий исходящие запросы к Telegram API
+class ProfiledRequestMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        trace = current_trace.get()
+        if trace is None:
+            return await make_request(bot, method)
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            trace.add_span(API, type(method).__name__, start, time.perf_counter())
+
+
+class Profiler:
+    def __init__(self, sample_rate: float = 0.1, dump_path: str = 'profile.speedscope.json',
+                 dump_interval: float = 60, max_traces: int = 1000):
+        self.sample_rate = sample_rate
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.traces = deque(maxlen=max_traces)
+        self._dumped_count = 0
+        self._total_count = 0
+        # Число апдейтов из выборки, которые обрабатываются прямо сейчас
+        self._active = 0
+        self._attached = False
+        self._last_sampled = 0.0
+
+    # Подключение к диспетчеру, боту и БД (вызывается только при PROFILING=1)
+    def install(self, dp, bot, engine, session_factory):
+        self._dp = dp
+        self._bot = bot
+        self._storage = dp.fsm.storage
+        self._profiled_storage = ProfiledStorage(dp.fsm.storage)
+        self._request_middleware = ProfiledRequestMiddleware()
+        self._db_listeners = [
+            # Запросы в обход ORM
+            (engine, 'before_cursor_execute', self._before_cursor_execute),
+            (engine, 'after_cursor_execute', self._after_cursor_execute),
+            (engine, 'handle_error', self._handle_error),
+            # ORM: запросы вместе с загрузкой строк, flush и commit (включая fsync SQLite)
+            (session_factory, 'do_orm_execute', self._do_orm_execute),
+            (session_factory, 'before_flush', self._before_flush),
+            (session_factory, 'after_flush_postexec', self._db_end),
+            (session_factory, 'before_commit', self._before_commit),
+            (session_factory, 'after_commit', self._db_end),
+            (session_factory, 'after_rollback', self._after_rollback),
+        ]
+
+        # Трасса начинается до FSM-middleware диспетчера, чтобы учесть чтение состояния
+        feed_update = dp.feed_update
+
+        async def profiled_feed_update(bot, update, **kwargs):
+            if random.random() >= self.sample_rate:
+                if self._attached and not self._active and time.monotonic() - self._last_sampled > DETACH_DELAY:
+                    self._detach()
+                return await feed_update(bot, update, **kwargs)
+            trace = UpdateTrace(update.update_id, update.event_type)
+            token = current_trace.set(trace)
+            if not self._attached:
+                self._attach()
+            self._active += 1
+            try:
+                return await TimedCoroutine(feed_update(bot, update, **kwargs), trace)
+            finally:
+                trace.duration = time.perf_counter() - trace.start
+                current_trace.reset(token)
+                self._active -= 1
+                self._last_sampled = time.monotonic()
+                self._record(trace)
+
+        dp.feed_update = profiled_feed_update
+
+    # Хуки подключаются с первым апдейтом из выборки и снимаются, когда таких
+    # апдейтов не было DETACH_DELAY секунд. Остальные апдейты в это время идут
+    # мимо трасс (current_trace пуст), а без выборки aiogram и SQLAlchemy
+    # работают без изменений. Снятие откладывается, потому что event.listen/remove
+    # в SQLAlchemy стоят ~0.1 мс
+    def _attach(self):
+        self._attached = True
+        self._dp.fsm.storage = self._profiled_storage
+        self._bot.session.middleware(self._request_middleware)
+        for target, name, listener in self._db_listeners:
+            event.listen(target, name, listener)
+        self._dp.message.middleware(self._handler_middleware)
+        self._dp.callback_query.middleware(self._handler_middleware)
+
+    def _detach(self):
+        self._attached = False
+        self._dp.fsm.storage = self._storage
+        self._bot.session.middleware.unregister(self._request_middleware)
+        for target, name, listener in self._db_listeners:
+            event.remove(target, name, listener)
+        self._dp.message.middleware.unregister(self._handler_middleware)
+        self._dp.callback_query.middleware.unregister(self._handler_middleware)
+
+    def _record(self, trace):
+        self.traces.append(trace)
+        self._total_count += 1
+
+    @staticmethod
+    async def _handler_middleware(handler, event, data):
+        trace = current_trace.get()
+        if trace is not None and 'handler' in data:
+            trace.handler = data['handler'].callback.__name__
+        return await handler(event, data)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.db_begin(statement.split(None, 1)[0].upper() if statement else 'SQL')
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.db_end()
+
+    @staticmethod
+    def _handle_error(exception_context):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.db_end()
+
+    @staticmethod
+    def _do_orm_execute(orm_execute_state):
+        # Результат возвращается как есть: компиляция, получение соединения и запрос
+        # попадают во время БД, а разбор строк при чтении результата — в handler
+        trace = current_trace.get()
+        if trace is None:
+            return None
+        trace.db_begin('SELECT' if orm_execute_state.is_select else 'EXECUTE')
+        try:
+            return orm_execute_state.invoke_statement()
+        finally:
+            trace.db_end()
+
+    @staticmethod
+    def _before_flush(session, flush_context, instances):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.db_begin('flush')
+
+    @staticmethod
+    def _before_commit(session):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.db_begin('commit')
+
+    @staticmethod
+    def _db_end(session, *args):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.db_end()
+
+    @staticmethod
+    def _after_rollback(session):
+        # После ошибки flush/commit закрываем все незавершённые операции
+        trace = current_trace.get()
+        if trace is not None:
+            trace.db_end(close_all=True)
+
+    def slowest(self, limit: int = 5):
+        return sorted(self.traces, key=lambda trace: trace.duration, reverse=True)[:max(limit, 0)]
+
+    # Выгрузка трасс в формате speedscope (https://www.speedscope.app)
+    @staticmethod
+    def to_speedscope(traces):
+        frames = []
+        frame_index = {}
+
+        def frame(name):
+            if name not in frame_index:
+                frame_index[name] = len(frames)
+                frames.append({'name': name})
+            return frame_index[name]
+
+        profiles = []
+        for trace in traces:
+            duration = trace.duration * 1000
+            root = frame(f"{trace.update_type}: {trace.handler or 'unhandled'}")
+            events = [{'type': 'O', 'frame': root, 'at': 0.0}]
+            position = 0.0
+            # Отрезки внутри апдейта идут последовательно, перекрытия обрезаем
+            for category, name, start, end in sorted(trace.spans, key=lambda span: span[2]):
+                start = min(max(start * 1000, position), duration)
+                end = min(max(end * 1000, start), duration)
+                span_frame = frame(f"{category}: {name}")
+                events.append({'type': 'O', 'frame': span_frame, 'at': start})
+                events.append({'type': 'C', 'frame': span_frame, 'at': end})
+                position = end
+            events.append({'type': 'C', 'frame': root, 'at': duration})
+            profiles.append({
+                'type': 'evented',
+                'name': f"#{trace.update_id} {trace.created_at.strftime('%d.%m.%Y %H:%M:%S')}",
+                'unit': 'milliseconds',
+                'startValue': 0.0,
+                'endValue': duration,
+                'events': events,
+            })
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': profiles,
+            'name': 'bot updates',
+            'exporter': 'my-telegram-bot profiling',
+        }
+
+    def _write(self, traces):
+        tmp_path = f"{self.dump_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_speedscope(traces), f, ensure_ascii=False)
+        os.replace(tmp_path, self.dump_path)
+        logger.info(f"Профиль сохранён в {self.dump_path} ({len(traces)} апдейтов)")
+
+    # Синхронная выгрузка (при остановке бота)
+    def dump(self):
+        if self._total_count == self._dumped_count:
+            return
+        self._dumped_count = self._total_count
+        self._write(list(self.traces))
+
+    # Фоновая задача периодической выгрузки: записанные трассы уже не меняются,
+    # поэтому снимок списка сериализуется в отдельном потоке, не блокируя event loop
+    async def run_dumper(self):
+        while True:
+            await asyncio.sleep(self.dump_interval)
+            if self._total_count == self._dumped_count:
+                continue
+            self._dumped_count = self._total_count
+            try:
+                await asyncio.to_thread(self._write, list(self.traces))
+            except OSError as e:
+                logger.error(f"Ошибка сохранения профиля: {e}")